@@ -32,12 +32,25 @@ python3 populate.py --cities "new york" "san francisco"
 python3 populate.py --merge
 
 # Custom settings
-python3 populate.py --per-type 150 --delay 1.0
+python3 populate.py --per-type 150 --concurrency 16
 """
 
-import argparse, json, os, re, time, csv, sys
-from typing import Dict, List, Tuple
-from openai import OpenAI
+import argparse, asyncio, copy, functools, hashlib, json, math, os, random, re, time, csv, sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+try:
+    import tiktoken
+except ImportError:  # token estimates fall back to ~4 characters per token
+    tiktoken = None
+
+try:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch either
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 PARTNER_TYPES = ["influencer", "podcaster", "journalist", "activist", "ngo", "other"]
 
@@ -63,12 +76,52 @@ ISO3 = {
     "philippines":"PHL","japan":"JPN","south_korea":"KOR","china":"CHN","australia":"AUS"
 }
 
+# Main language per country slug; anything missing defaults to English
+COUNTRY_LANG = {
+    "mexico":"es","spain":"es","argentina":"es","colombia":"es","peru":"es","chile":"es",
+    "brazil":"pt","france":"fr","germany":"de","italy":"it","russia":"ru","turkey":"tr","egypt":"ar",
+    "india":"hi","indonesia":"id","thailand":"th","japan":"ja","south_korea":"ko",
+    "china":"zh","hong_kong_china":"zh","iran":"fa","pakistan":"ur","philippines":"tl"
+}
+
 # Normalize 2-letter languages from your JSON
 LANG_MAP = {
     "en":"en","es":"es","pt":"pt","fr":"fr","de":"de","it":"it","ru":"ru","tr":"tr","ar":"ar","sw":"sw",
     "hi":"hi","id":"id","th":"th","ja":"ja","ko":"ko","zh":"zh","ph":"tl","fa":"fa","ur":"ur","tl":"tl"
 }
 
+# Attempts per OpenAI request before a 429/5xx/connection error is surfaced
+MAX_RETRIES = 6
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# Seconds between status checks while waiting on a Batch API job
+BATCH_POLL_SECONDS = 30
+# Where run_batch records the id of the batch it is waiting on, relative to --out
+BATCH_STATE_FILE = ".batch_id"
+
+# Minimum model calls per city/type; each asks for up to ~2x the rows we keep, so two usually suffice
+MAX_ATTEMPTS = 2
+
+# Instagram handles collected so far this run, per (ISO-3 country from country_iso3, partner type)
+# and keyed by contact_key; a sample is listed in later prompts for the same country so the model skips them
+GLOBAL_SEEN: Dict[Tuple[str, str], Dict[int, str]] = defaultdict(dict)
+MAX_EXCLUDED_HANDLES = 30
+
+# Expected completion size per requested contact, used for TPM budgeting. Rows under out/ average
+# ~275 JSON characters (~69 tokens); the bucket is corrected from usage.total_tokens after each call
+COMPLETION_TOKENS_PER_CONTACT = 75
+
+# Output tokens a single call may plan for, well under gpt-4o's 16,384-token completion cap,
+# so larger requests don't end in truncated JSON
+COMPLETION_TOKEN_BUDGET = 12000
+MAX_CONTACTS_PER_REQUEST = COMPLETION_TOKEN_BUDGET // COMPLETION_TOKENS_PER_CONTACT
+
+# Write buffer for output CSVs, so each file goes out in a few large writes
+CSV_BUFFER_SIZE = 1 << 20
+
+_SANITIZE_RE = re.compile(r"[^a-zA-Z0-9._-]+")
+
 CSV_HEADER = ["name","email","country","language","city","instagram","twitter","phone","organization","type","notes"]
 
 JSON_SCHEMA = {
@@ -124,13 +177,13 @@ SYSTEM = (
 )
 
 def sanitize(s: str) -> str:
-    return re.sub(r"[^a-zA-Z0-9._-]+", "_", s.strip())
-
-def to_iso3(country_slug: str) -> str:
-    return ISO3.get(country_slug.lower(), country_slug.upper()[:3])
+    return _SANITIZE_RE.sub("_", s.strip())
 
-def to_lang2(lang_code: str) -> str:
-    return LANG_MAP.get(lang_code.lower(), lang_code.lower()[:2])
+def city_codes(city: dict) -> Tuple[str, str]:
+    """Return the (ISO-3 country, ISO-2 language) codes for a city object."""
+    country_slug = city.get("country","").lower()
+    lang_code = (city.get("map") or {}).get("language","en").lower()
+    return ISO3.get(country_slug, country_slug.upper()[:3]), LANG_MAP.get(lang_code, lang_code[:2])
 
 
 def ensure_dir(p: str) -> None:
@@ -145,24 +198,65 @@ def clean_invalid_csv(file_path: str) -> None:
         except OSError as e:
             print(f"    Warning: Could not remove invalid CSV {file_path}: {e}", file=sys.stderr)
 
-def write_csv(path: str, rows: List[Dict]) -> None:
-    # Clean any existing invalid file first
-    if os.path.exists(path) and not is_valid_csv_file(path):
+def write_csv(path: str, rows: List[Dict], clean_invalid: bool = True) -> None:
+    # Clean any existing invalid file first (skipped for temp files, which are simply overwritten)
+    if clean_invalid and os.path.exists(path) and not is_valid_csv_file(path):
         clean_invalid_csv(path)
 
     ensure_dir(os.path.dirname(path))
-    with open(path, "w", encoding="utf-8", newline="") as f:
+    with open(path, "w", encoding="utf-8", newline="", buffering=CSV_BUFFER_SIZE) as f:
         w = csv.DictWriter(f, fieldnames=CSV_HEADER)
         w.writeheader()
-        for r in rows:
-            out = {k: r.get(k, "") or "" for k in CSV_HEADER}
-            w.writerow(out)
+        w.writerows({k: r.get(k, "") or "" for k in CSV_HEADER} for r in rows)
+
+def contact_key(r: Dict) -> int:
+    """64-bit dedup key from a row's email, else its Instagram handle; 0 if it has neither."""
+    email = (r.get("email") or "").lower().strip()
+    instagram = (r.get("instagram") or "").lower().strip()
+    s = email or (instagram and "ig:" + instagram)
+    if not s:
+        return 0
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8, person=b"cl").digest(), "big")
+
+def write_csv_atomic(path: str, rows: List[Dict]) -> None:
+    """Write `rows` to a temp file and rename it over `path`, so a crash never leaves a torn file."""
+    tmp = path + ".tmp"
+    write_csv(tmp, rows, clean_invalid=False)
+    os.replace(tmp, path)
+
+def write_checkpoint(path: str, rows: List[Dict]) -> None:
+    """Atomically checkpoint the rows collected so far for `path` to `path`.partial."""
+    write_csv_atomic(path + ".partial", rows)
+
+def replace_csv(path: str, rows: List[Dict]) -> None:
+    """Atomically write the final `rows` to `path` and drop its .partial checkpoint."""
+    write_csv_atomic(path, rows)
+    partial = path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+
+def load_partial(path: str) -> List[Dict]:
+    """Rows checkpointed in `path`.partial by an interrupted run, or [] if there are none.
+
+    Checkpoints with an unexpected header are ignored, as are rows without an email or Instagram.
+    """
+    partial = path + ".partial"
+    if not os.path.exists(partial):
+        return []
+    try:
+        with open(partial, "r", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            if reader.fieldnames != CSV_HEADER:
+                return []
+            return [row for row in reader if contact_key(row)]
+    except (IOError, csv.Error, UnicodeDecodeError):
+        return []
 
 def dedupe(rows: List[Dict]) -> List[Dict]:
-    seen: set = set()
+    seen: set[int] = set()
     out = []
     for r in rows:
-        key = (r.get("email") or "").lower().strip() or ("ig:" + (r.get("instagram") or "").lower().strip())
+        key = contact_key(r)
         if key and key not in seen:
             seen.add(key)
             out.append(r)
@@ -186,10 +280,26 @@ def city_display(city_obj: dict) -> str:
 #    ]
 #    return "\n".join(pieces)
 
-def build_user_prompt(city: dict, partner_type: str, iso3: str, lang2: str) -> str:
+def contacts_per_request(per_type: int) -> int:
+    """How many contacts to ask the model for per call, to amortize round trips over more rows."""
+    return min(max(per_type * 2, 150), MAX_CONTACTS_PER_REQUEST)
+
+def attempts_per_type(per_type: int) -> int:
+    """Model calls allowed per city/type: enough to request ~2x `per_type` rows in total."""
+    return max(MAX_ATTEMPTS, math.ceil(per_type * 2 / contacts_per_request(per_type)))
+
+@functools.lru_cache(maxsize=None)
+def contacts_schema(min_items: int) -> dict:
+    """JSON_SCHEMA with the contacts array's minItems set to `min_items`."""
+    schema = copy.deepcopy(JSON_SCHEMA)
+    schema["schema"]["properties"]["contacts"]["minItems"] = min_items
+    return schema
+
+def build_user_prompt(city: dict, partner_type: str, iso3: str, lang2: str, count: int = 100,
+                      exclude_handles: Sequence[str] = ()) -> str:
     name = city.get("id","").replace("_"," ").title()
     pieces = [
-        f"Task: Propose at least 100 '{partner_type}' contacts in or strongly tied to {name}.",
+        f"Task: Propose at least {count} '{partner_type}' contacts in or strongly tied to {name}.",
         "",
         "Context — WorldWideWaves (WWW):",
         "- A synchronized, city-by-city social 'wave' amplifying messages on climate, peace/war prevention, nature protection, and geopolitics.",
@@ -225,18 +335,219 @@ def build_user_prompt(city: dict, partner_type: str, iso3: str, lang2: str) -> s
         f"Hard constraints: country={iso3}, language={lang2}, type={partner_type}.",
         "If unsure about an email, set email=null and prefer instagram.",
     ]
+    if exclude_handles:
+        pieces.append(f"Exclude these already-collected handles: {', '.join(exclude_handles)}.")
     return '\n'.join(pieces)
 
-def call_openai(client: OpenAI, model: str, system: str, user: str) -> dict:
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
+def parse_duration(value: str) -> Optional[float]:
+    """Parse OpenAI reset durations such as '20ms', '1.5s' or '6m0s' into seconds."""
+    parts = _DURATION_RE.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Return how long the API asked us to wait, from retry-after or x-ratelimit-reset-* headers."""
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass  # HTTP-date form, fall back to the reset headers
+    resets = [parse_duration(headers.get(h, "")) for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+def _header_number(headers, name: str) -> Optional[float]:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def estimate_tokens(text: str, model: str) -> int:
+    """Estimate the prompt token count of `text` for `model`."""
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text))
+
+class RateLimiter:
+    """Two token buckets (requests/min and tokens/min) refilled every second.
+
+    Callers `await acquire(est_tokens)` before each request; the buckets are
+    re-synced from the x-ratelimit-* headers OpenAI returns with every response.
+    A 429 trips a shared gate via `pause()`, holding every caller until it reopens.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self._cond = asyncio.Condition()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._gate = asyncio.Event()
+        self._gate.set()
+
+    async def __aenter__(self) -> "RateLimiter":
+        self._refill_task = asyncio.create_task(self._refill())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._refill_task.cancel()
+        try:
+            await self._refill_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _refill(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            async with self._cond:
+                self.requests = min(self.rpm, self.requests + self.rpm / 60)
+                self.tokens = min(self.tpm, self.tokens + self.tpm / 60)
+                self._cond.notify_all()
+
+    async def acquire(self, est_tokens: int) -> None:
+        """Wait until one request and `est_tokens` tokens are available, then take them."""
+        async with self._cond:
+            # The gate is part of the predicate so callers already queued here also hold while it is closed;
+            # a single call larger than the whole TPM budget only needs a full bucket
+            await self._cond.wait_for(
+                lambda: self._gate.is_set() and self.requests >= 1 and self.tokens >= min(est_tokens, self.tpm)
+            )
+            self.requests -= 1
+            self.tokens -= min(est_tokens, self.tpm)
+
+    async def settle(self, est_tokens: int, used_tokens: int) -> None:
+        """Credit or debit the token bucket by the difference between the estimate and actual usage."""
+        async with self._cond:
+            self.tokens = min(self.tpm, self.tokens + min(est_tokens, self.tpm) - used_tokens)
+            self._cond.notify_all()
+
+    async def pause(self, seconds: float) -> None:
+        """Hold all callers for `seconds`; a caller hitting an already-tripped gate just waits for it to reopen."""
+        if not self._gate.is_set():
+            await self._gate.wait()
+            return
+        self._gate.clear()
+        print(f"    [retry] rate limited, pausing all requests for {seconds:.1f}s", file=sys.stderr)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            async with self._cond:
+                self._gate.set()
+                self._cond.notify_all()
+
+    def update(self, headers) -> None:
+        """Adopt the limits and remaining budget reported in x-ratelimit-* response headers."""
+        if not headers:
+            return
+        limit_requests = _header_number(headers, "x-ratelimit-limit-requests")
+        limit_tokens = _header_number(headers, "x-ratelimit-limit-tokens")
+        remaining_requests = _header_number(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_number(headers, "x-ratelimit-remaining-tokens")
+        if limit_requests:
+            self.rpm = int(limit_requests)
+        if limit_tokens:
+            self.tpm = int(limit_tokens)
+        # The server's view already accounts for other clients on the same key
+        if remaining_requests is not None:
+            self.requests = min(self.requests, remaining_requests)
+        if remaining_tokens is not None:
+            self.tokens = min(self.tokens, remaining_tokens)
+
+async def create_with_retries(client: AsyncOpenAI, limiter: RateLimiter, est_tokens: int, **kwargs):
+    """Create a chat completion, retrying 429s, 5xx and connection errors with backoff + jitter."""
+    for attempt in range(MAX_RETRIES):
+        last = attempt == MAX_RETRIES - 1
+        await limiter.acquire(est_tokens)
+        try:
+            raw = await client.chat.completions.with_raw_response.create(**kwargs)
+            resp = raw.parse()
+            usage = getattr(resp, "usage", None)
+            if usage and usage.total_tokens:
+                await limiter.settle(est_tokens, usage.total_tokens)
+            limiter.update(raw.headers)
+            return resp
+        except openai.RateLimitError as e:
+            limiter.update(e.response.headers)
+            # An exhausted quota will not recover by waiting
+            if last or e.code == "insufficient_quota":
+                raise
+            wait = retry_after_seconds(e.response.headers)
+            if wait is None:
+                wait = min(60, 2 ** attempt)
+            # Rate limits are organization-wide, so back off every in-flight task together
+            await limiter.pause(wait + random.uniform(0, 0.5))
+            continue
+        except (openai.APIConnectionError, openai.APIStatusError) as e:
+            if last or (isinstance(e, openai.APIStatusError) and e.status_code < 500):
+                raise
+            wait = min(60, 2 ** attempt) + random.random()
+            print(f"    [retry] {type(e).__name__}, waiting {wait:.1f}s", file=sys.stderr)
+        await asyncio.sleep(wait)
+
+def completion_body(model: str, system: str, user: str, min_items: int = 100) -> dict:
+    """Request body for a structured contacts completion, shared by the realtime and Batch APIs."""
+    return {
+        "model": model,
+        "messages": [
             {"role":"system","content":system},
             {"role":"user","content":user},
         ],
-        response_format={"type":"json_schema","json_schema":JSON_SCHEMA},
-        temperature=0.2,
-    )
+        "response_format": {"type":"json_schema","json_schema":contacts_schema(min_items)},
+        "temperature": 0.2,
+    }
+
+def parse_contacts_json(raw_content: str) -> dict:
+    """Parse the model's JSON text, repairing a truncated contacts array when possible."""
+    try:
+        # Try to fix common JSON issues before parsing
+        cleaned_content = raw_content.strip()
+        if cleaned_content and not cleaned_content.endswith('}'):
+            # If JSON appears truncated, try to find the last complete contact and close the JSON
+            last_complete = cleaned_content.rfind('"}')
+            if last_complete > -1:
+                # Find the start of the incomplete contact
+                incomplete_start = cleaned_content.rfind(',{', 0, last_complete + 2)
+                if incomplete_start > -1:
+                    cleaned_content = cleaned_content[:incomplete_start] + ']}'
+                else:
+                    cleaned_content = cleaned_content[:last_complete + 2] + ']}'
+
+        data = json_loads(cleaned_content)
+    except json.JSONDecodeError as e:
+        # Try to provide more helpful error context
+        error_msg = f"Failed to parse JSON response: {e}"
+        error_msg += f" (Response length: {len(raw_content)} chars)"
+        # Show a snippet around the error location if possible
+        if hasattr(e, 'pos') and e.pos:
+            start = max(0, e.pos - 50)
+            end = min(len(raw_content), e.pos + 50)
+            snippet = raw_content[start:end]
+            error_msg += f" Near: ...{snippet}..."
+        raise RuntimeError(error_msg)
+
+    if not isinstance(data, dict) or "contacts" not in data:
+        raise RuntimeError("Model did not return expected JSON with 'contacts'.")
+    return data
+
+async def call_openai(client: AsyncOpenAI, limiter: RateLimiter, model: str, system: str, user: str,
+                      est_tokens: int, min_items: int = 100) -> dict:
+    resp = await create_with_retries(client, limiter, est_tokens, **completion_body(model, system, user, min_items))
     # Parse response from chat completions API
     data = None
     raw_content = None
@@ -250,68 +561,68 @@ def call_openai(client: OpenAI, model: str, system: str, user: str) -> dict:
                 data = message.parsed
             elif hasattr(message, "content") and message.content:
                 raw_content = message.content
-                # Try to fix common JSON issues before parsing
-                cleaned_content = raw_content.strip()
-                if cleaned_content and not cleaned_content.endswith('}'):
-                    # If JSON appears truncated, try to find the last complete contact and close the JSON
-                    last_complete = cleaned_content.rfind('"}')
-                    if last_complete > -1:
-                        # Find the start of the incomplete contact
-                        incomplete_start = cleaned_content.rfind(',{', 0, last_complete + 2)
-                        if incomplete_start > -1:
-                            cleaned_content = cleaned_content[:incomplete_start] + ']}'
-                        else:
-                            cleaned_content = cleaned_content[:last_complete + 2] + ']}'
-
-                data = json.loads(cleaned_content)
             else:
                 raise RuntimeError("No content found in response")
         else:
             raise RuntimeError("No valid response structure found")
-    except json.JSONDecodeError as e:
-        # Try to provide more helpful error context
-        error_msg = f"Failed to parse JSON response: {e}"
-        if raw_content:
-            error_msg += f" (Response length: {len(raw_content)} chars)"
-            # Show a snippet around the error location if possible
-            if hasattr(e, 'pos') and e.pos:
-                start = max(0, e.pos - 50)
-                end = min(len(raw_content), e.pos + 50)
-                snippet = raw_content[start:end]
-                error_msg += f" Near: ...{snippet}..."
-        raise RuntimeError(error_msg)
     except Exception as e:
         raise RuntimeError(f"Failed to parse model output: {e}")
 
+    if raw_content is not None:
+        return parse_contacts_json(raw_content)
     if not isinstance(data, dict) or "contacts" not in data:
         raise RuntimeError("Model did not return expected JSON with 'contacts'.")
     return data
 
+def country_iso3(city_id: str) -> str:
+    """ISO-3 code of the longest known country suffix of a city id, e.g. 'san_francisco_usa' -> 'USA'.
+
+    Falls back to the city id itself, so unknown countries never share a GLOBAL_SEEN bucket.
+    """
+    parts = city_id.split("_")
+    for i in range(1, len(parts)):
+        iso3 = ISO3.get("_".join(parts[i:]))
+        if iso3:
+            return iso3
+    return city_id
+
+def remember_contact(country: str, partner_type: str, key: int, item: Dict) -> None:
+    """Record a collected contact's Instagram handle for the country/type exclusion list."""
+    handle = (item.get("instagram") or "").strip()
+    if key and handle:
+        GLOBAL_SEEN[(country, partner_type)].setdefault(key, handle if handle.startswith("@") else "@" + handle)
+
+def known_handles(country: str, partner_type: str) -> List[str]:
+    """Sample up to MAX_EXCLUDED_HANDLES handles already collected for this country/type."""
+    handles = list(GLOBAL_SEEN[(country, partner_type)].values())
+    return random.sample(handles, min(len(handles), MAX_EXCLUDED_HANDLES))
+
+def normalize_contact(r: Dict, iso3: str, lang2: str, city_name: str, partner_type: str) -> Optional[Dict]:
+    """Coerce a model row to the CSV fields, or return None if it has no name or no email/Instagram."""
+    item = {
+        "name": (r.get("name") or "").strip(),
+        "email": (r.get("email") or None),
+        "country": iso3,
+        "language": lang2,
+        "city": city_name,
+        "instagram": (r.get("instagram") or None),
+        "twitter": (r.get("twitter") or None),
+        "phone": (r.get("phone") or None),
+        "organization": (r.get("organization") or None),
+        "type": partner_type,
+        "notes": (r.get("notes") or None)
+    }
+    # Require either email or instagram
+    if not (item["email"] or item["instagram"]):
+        return None
+    # Skip blanks
+    if not item["name"]:
+        return None
+    return item
+
 def enforce_and_trim(rows: List[Dict], needed: int, iso3: str, lang2: str, city_name: str, partner_type: str) -> List[Dict]:
-    normalized = []
-    for r in rows:
-        item = {
-            "name": (r.get("name") or "").strip(),
-            "email": (r.get("email") or None),
-            "country": iso3,
-            "language": lang2,
-            "city": city_name,
-            "instagram": (r.get("instagram") or None),
-            "twitter": (r.get("twitter") or None),
-            "phone": (r.get("phone") or None),
-            "organization": (r.get("organization") or None),
-            "type": partner_type,
-            "notes": (r.get("notes") or None)
-        }
-        # Require either email or instagram
-        if not (item["email"] or item["instagram"]):
-            continue
-        # Skip blanks
-        if not item["name"]:
-            continue
-        normalized.append(item)
-    normalized = dedupe(normalized)
-    return normalized[:needed]
+    normalized = [item for item in (normalize_contact(r, iso3, lang2, city_name, partner_type) for r in rows) if item]
+    return dedupe(normalized)[:needed]
 
 def is_valid_csv_file(file_path: str) -> bool:
     """Check if CSV file exists, is not empty, has proper header, and contains data rows."""
@@ -347,15 +658,6 @@ def is_valid_csv_file(file_path: str) -> bool:
     except (IOError, csv.Error, UnicodeDecodeError):
         return False
 
-def get_missing_types(out_root: str, city_id: str) -> List[str]:
-    """Check which partner types are missing or invalid for a city and return the list of missing types."""
-    missing_types = []
-    for partner_type in PARTNER_TYPES:
-        out_path = os.path.join(out_root, sanitize(city_id), partner_type, "contacts.csv")
-        if not is_valid_csv_file(out_path):
-            missing_types.append(partner_type)
-    return missing_types
-
 def create_default_cities() -> List[dict]:
     """Create city objects from default city list with inferred country and language."""
     cities = []
@@ -364,41 +666,7 @@ def create_default_cities() -> List[dict]:
         if len(parts) >= 2:
             country = "_".join(parts[1:])  # Everything after the first underscore
             # Infer language from country
-            lang = "en"  # default
-            if country in ["mexico", "spain", "argentina", "colombia", "peru", "chile"]:
-                lang = "es"
-            elif country in ["brazil"]:
-                lang = "pt"
-            elif country in ["france"]:
-                lang = "fr"
-            elif country in ["germany"]:
-                lang = "de"
-            elif country in ["italy"]:
-                lang = "it"
-            elif country in ["russia"]:
-                lang = "ru"
-            elif country in ["turkey"]:
-                lang = "tr"
-            elif country in ["egypt"]:
-                lang = "ar"
-            elif country in ["india"]:
-                lang = "hi"
-            elif country in ["indonesia"]:
-                lang = "id"
-            elif country in ["thailand"]:
-                lang = "th"
-            elif country in ["japan"]:
-                lang = "ja"
-            elif country in ["south_korea"]:
-                lang = "ko"
-            elif country in ["china", "hong_kong_china"]:
-                lang = "zh"
-            elif country in ["iran"]:
-                lang = "fa"
-            elif country in ["pakistan"]:
-                lang = "ur"
-            elif country in ["philippines"]:
-                lang = "tl"
+            lang = COUNTRY_LANG.get(country, "en")
 
             city_obj = {
                 "id": city_id,
@@ -408,103 +676,274 @@ def create_default_cities() -> List[dict]:
             cities.append(city_obj)
     return cities
 
+DEFAULT_CITY_OBJECTS = create_default_cities()
+
+def iter_contact_csvs(root: str):
+    """Yield the path of every contacts.csv under `root` (depth-first, symlinks not followed).
+
+    Missing or unreadable directories are skipped, like os.walk does.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_contact_csvs(entry.path)
+        elif entry.name == "contacts.csv":
+            yield entry.path
+
 def merge_csvs(out_root: str, merge_output: str = "merged_contacts.csv") -> None:
-    """Merge all CSV files in the output directory into one big CSV, checking for duplicates."""
-    all_contacts = []
-    seen_keys = set()
+    """Merge all CSV files in the output directory into one big CSV, checking for duplicates.
+
+    Rows are streamed to a temp file that replaces `merge_output` only if something was merged;
+    only the dedup keys are kept in memory.
+    """
+    seen_keys: set[int] = set()
+
+    def unique_rows(reader):
+        for row in reader:
+            key = contact_key(row)
+            if key and key not in seen_keys:
+                seen_keys.add(key)
+                # Ensure all fields are present
+                yield {k: row.get(k, "") or "" for k in CSV_HEADER}
 
     print(f"Scanning {out_root} for CSV files...")
 
-    # Walk through all subdirectories and find contacts.csv files
-    for root, dirs, files in os.walk(out_root):
-        if "contacts.csv" in files:
-            csv_path = os.path.join(root, "contacts.csv")
-            try:
-                with open(csv_path, "r", encoding="utf-8", newline="") as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        # Create a unique key for deduplication
-                        email = (row.get("email") or "").lower().strip()
-                        instagram = (row.get("instagram") or "").lower().strip()
-                        key = email or ("ig:" + instagram)
-
-                        if key and key not in seen_keys:
-                            seen_keys.add(key)
-                            all_contacts.append(row)
-
-                print(f"Processed {csv_path}")
-            except Exception as e:
-                print(f"Error reading {csv_path}: {e}", file=sys.stderr)
-
-    # Write merged file
-    if all_contacts:
-        with open(merge_output, "w", encoding="utf-8", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
+    # Stream into a temp file so an existing merge_output survives an empty or failed scan
+    tmp_output = merge_output + ".tmp"
+    try:
+        with open(tmp_output, "w", encoding="utf-8", newline="", buffering=CSV_BUFFER_SIZE) as out:
+            writer = csv.DictWriter(out, fieldnames=CSV_HEADER)
             writer.writeheader()
-            for contact in all_contacts:
-                # Ensure all fields are present
-                row = {k: contact.get(k, "") or "" for k in CSV_HEADER}
-                writer.writerow(row)
 
-        print(f"Merged {len(all_contacts)} unique contacts into {merge_output}")
+            # Walk through all subdirectories and find contacts.csv files
+            for csv_path in iter_contact_csvs(out_root):
+                try:
+                    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+                        writer.writerows(unique_rows(csv.DictReader(f)))
+
+                    print(f"Processed {csv_path}")
+                except Exception as e:
+                    print(f"Error reading {csv_path}: {e}", file=sys.stderr)
+
+        if seen_keys:
+            os.replace(tmp_output, merge_output)
+    finally:
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+
+    merged = len(seen_keys)
+    if merged:
+        print(f"Merged {merged} unique contacts into {merge_output}")
     else:
         print("No contacts found to merge.")
 
-def run_for_city(client: OpenAI, model: str, city: dict, per_type: int, delay: float, out_root: str):
-    iso3 = to_iso3(city.get("country",""))
-    lang2 = to_lang2((city.get("map") or {}).get("language","en"))
+def get_pending_types(out_root: str, city: dict) -> List[Tuple[str, str]]:
+    """Report and return (partner type, CSV path) for every type that is missing or invalid for a city."""
     city_id = city.get("id")
-    city_name = city_display(city)
+    city_dir = os.path.join(out_root, sanitize(city_id))
 
-    # Get missing partner types for this city
-    missing_types = get_missing_types(out_root, city_id)
+    pending = []
+    invalid_files = []
+    new_files = []
+    for ptype in PARTNER_TYPES:
+        out_path = os.path.join(city_dir, ptype, "contacts.csv")
+        if is_valid_csv_file(out_path):
+            continue
+        pending.append((ptype, out_path))
+        # Files that exist but are invalid will be regenerated
+        (invalid_files if os.path.exists(out_path) else new_files).append(ptype)
 
-    if not missing_types:
+    if not pending:
         print(f"  All partner types already exist for {city_id}")
-        return
-
-    # Check which files exist but are invalid (will be regenerated)
-    invalid_files = []
-    for ptype in missing_types:
-        out_path = os.path.join(out_root, sanitize(city_id), ptype, "contacts.csv")
-        if os.path.exists(out_path) and not is_valid_csv_file(out_path):
-            invalid_files.append(ptype)
+        return []
 
     if invalid_files:
         print(f"  Invalid/empty files to regenerate for {city_id}: {', '.join(invalid_files)}")
 
-    new_files = [ptype for ptype in missing_types if ptype not in invalid_files]
     if new_files:
         print(f"  New types to create for {city_id}: {', '.join(new_files)}")
 
-    for i, ptype in enumerate(missing_types, 1):
-        print(f"  [{i}/{len(missing_types)}] Processing {ptype}...")
-        need = per_type
-        collected: List[Dict] = []
-        attempts = 0
-        seen_keys: set = set()
-
-        while len(collected) < need and attempts < 4:
-            prompt = build_user_prompt(city, ptype, iso3, lang2)
-            data = call_openai(client, model, SYSTEM, prompt)
-            rows = enforce_and_trim(data.get("contacts", []), need*2, iso3, lang2, city_name, ptype)
-            # Local de-dup across attempts
-            new_batch = []
-            for r in rows:
-                key = (r.get("email") or "").lower().strip() or ("ig:" + (r.get("instagram") or "").lower().strip())
-                if key and key not in seen_keys:
-                    seen_keys.add(key)
-                    new_batch.append(r)
-            collected.extend(new_batch)
-            attempts += 1
-            time.sleep(delay)
-
-        collected = collected[:need]
-        # Write CSV
-        out_dir = os.path.join(out_root, sanitize(city_id), ptype)
-        out_path = os.path.join(out_dir, "contacts.csv")
-        write_csv(out_path, collected)
-        print(f"    Wrote {len(collected):3d} → {out_path}")
+    return pending
+
+async def run_for_city(client: AsyncOpenAI, limiter: RateLimiter, model: str, city: dict, ptype: str,
+                       per_type: int, out_path: str) -> List[Dict]:
+    """Collect the contacts to write to `out_path` for one city/type pair."""
+    iso3, lang2 = city_codes(city)
+    city_name = city_display(city)
+
+    need = per_type
+    # Resume from the rows an interrupted run checkpointed
+    collected: List[Dict] = await asyncio.to_thread(load_partial, out_path)
+    attempts = 0
+    seen_keys: set[int] = {contact_key(r) for r in collected}
+    if collected:
+        print(f"    Resuming {city.get('id')}/{ptype} from {len(collected)} checkpointed rows")
+    request_size = contacts_per_request(need)
+    country = country_iso3(city.get("id",""))
+    pool = GLOBAL_SEEN[(country, ptype)]
+    for r in collected:
+        remember_contact(country, ptype, contact_key(r), r)
+    pool_size_at_prompt = None
+
+    max_attempts = attempts_per_type(need)
+    while len(collected) < need and attempts < max_attempts:
+        # Rebuild and re-tokenize the prompt only when new handles arrived since the last one
+        if len(pool) != pool_size_at_prompt:
+            pool_size_at_prompt = len(pool)
+            prompt = build_user_prompt(city, ptype, iso3, lang2, request_size, known_handles(country, ptype))
+            est_tokens = estimate_tokens(SYSTEM + prompt, model) + request_size * COMPLETION_TOKENS_PER_CONTACT
+        data = await call_openai(client, limiter, model, SYSTEM, prompt, est_tokens, request_size)
+        # Normalize and de-dup in one pass, against everything collected in earlier attempts
+        for raw in data.get("contacts", []):
+            item = normalize_contact(raw, iso3, lang2, city_name, ptype)
+            if item is None:
+                continue
+            key = contact_key(item)
+            if not key or key in seen_keys:
+                continue
+            seen_keys.add(key)
+            collected.append(item)
+            remember_contact(country, ptype, key, item)
+            if len(collected) >= need:
+                break
+        attempts += 1
+        # Checkpoint so a failure in a later attempt doesn't discard these rows
+        if collected:
+            await asyncio.to_thread(write_checkpoint, out_path, collected)
+
+    # A resumed checkpoint may hold more rows than the current --per-type
+    return collected[:need]
+
+async def run_all(model: str, jobs: List[Tuple[dict, str, str]], per_type: int, concurrency: int,
+                  rpm: int, tpm: int) -> None:
+    """Run every city/type job with at most `concurrency` in flight, writing each CSV as soon as it is ready."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def bounded(city: dict, ptype: str, out_path: str) -> Optional[Tuple[str, List[Dict]]]:
+        # Jobs beyond the window wait here, so requests ramp up instead of all starting at t=0
+        async with sem:
+            print(f"  Processing {city.get('id')}/{ptype}...")
+            try:
+                return out_path, await run_for_city(client, limiter, model, city, ptype, per_type, out_path)
+            except Exception as e:
+                print(f"[warn] {city.get('id','unknown')}/{ptype}: {e}", file=sys.stderr)
+                return None
+
+    # Retries are handled by create_with_retries so the SDK's own retry loop is disabled
+    async with AsyncOpenAI(max_retries=0) as client, RateLimiter(rpm, tpm) as limiter:
+        tasks = [asyncio.ensure_future(bounded(city, ptype, out_path)) for city, ptype, out_path in jobs]
+        for done, fut in enumerate(asyncio.as_completed(tasks), 1):
+            result = await fut
+            if result is None:
+                continue
+            out_path, rows = result
+            try:
+                # Serialize off the event loop so in-flight requests keep progressing
+                await asyncio.to_thread(replace_csv, out_path, rows)
+                print(f"  [{done}/{len(jobs)}] Wrote {len(rows):3d} → {out_path}")
+            except OSError as e:
+                print(f"[warn] {out_path}: {e}", file=sys.stderr)
+
+def run_batch(client: OpenAI, model: str, jobs: List[Tuple[dict, str, str]], per_type: int, out_root: str) -> None:
+    """Generate every city/type job through the OpenAI Batch API (one request per pair).
+
+    The submitted batch id is saved in `out_root`/.batch_id, so an interrupted run resumes
+    polling that batch instead of submitting (and paying for) the same requests again.
+    """
+    by_id: Dict[str, Tuple[dict, str, str]] = {}
+    for city, ptype, out_path in jobs:
+        by_id[f"{city.get('id')}|{ptype}"] = (city, ptype, out_path)
+
+    state_path = os.path.join(out_root, BATCH_STATE_FILE)
+    batch = None
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            batch_id = f.read().strip()
+        try:
+            batch = client.batches.retrieve(batch_id)
+            print(f"Resuming batch {batch.id} (status {batch.status}), polling every {BATCH_POLL_SECONDS}s...")
+        except openai.NotFoundError:
+            print(f"[warn] saved batch {batch_id} not found, submitting a new one", file=sys.stderr)
+
+    if batch is None:
+        lines = []
+        request_size = contacts_per_request(per_type)
+        for custom_id, (city, ptype, _) in by_id.items():
+            iso3, lang2 = city_codes(city)
+            body = completion_body(model, SYSTEM, build_user_prompt(city, ptype, iso3, lang2, request_size), request_size)
+            lines.append(json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}))
+
+        batch_file = client.files.create(file=("contacts_batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        ensure_dir(out_root)
+        with open(state_path, "w", encoding="utf-8") as f:
+            f.write(batch.id)
+        print(f"Submitted batch {batch.id} with {len(lines)} requests, polling every {BATCH_POLL_SECONDS}s...")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_SECONDS)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        if counts:
+            print(f"  Batch {batch.status}: {counts.completed}/{counts.total} done, {counts.failed} failed")
+
+    # Expired or cancelled batches still expose the requests that did finish
+    if not batch.output_file_id:
+        print(f"[warn] batch {batch.id} ended with status {batch.status} and no output", file=sys.stderr)
+        errors = batch.errors.data if batch.errors and batch.errors.data else []
+        for err in errors:
+            line = f" (line {err.line})" if err.line else ""
+            print(f"  {err.code}: {err.message}{line}", file=sys.stderr)
+
+    written = 0
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            custom_id = ""
+            try:
+                result = json_loads(line)
+                custom_id = result.get("custom_id", "")
+                if custom_id not in by_id:
+                    print(f"[warn] {custom_id}: not among this run's pending city/type files, skipped", file=sys.stderr)
+                    continue
+                city, ptype, out_path = by_id[custom_id]
+                response = result.get("response") or {}
+                if response.get("status_code") != 200:
+                    raise RuntimeError(f"HTTP {response.get('status_code')}: {result.get('error') or response.get('body')}")
+                data = parse_contacts_json(response["body"]["choices"][0]["message"]["content"] or "")
+                iso3, lang2 = city_codes(city)
+                rows = enforce_and_trim(data.get("contacts", []), per_type, iso3, lang2, city_display(city), ptype)
+                # Also consumes any checkpoint a previous realtime run left for this file
+                replace_csv(out_path, rows)
+                written += 1
+                print(f"    Wrote {len(rows):3d} → {out_path}")
+            except Exception as e:
+                print(f"[warn] {custom_id or 'batch output line'}: {e}", file=sys.stderr)
+
+    # Per-request failures are reported in the error file, not the output file
+    if batch.error_file_id:
+        for line in client.files.content(batch.error_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                result = json_loads(line)
+                response = result.get("response") or {}
+                error = result.get("error") or (response.get("body") or {}).get("error") or {}
+                print(f"[warn] {result.get('custom_id', '')}: HTTP {response.get('status_code')}: "
+                      f"{error.get('message') or error}", file=sys.stderr)
+            except Exception as e:
+                print(f"[warn] batch error line: {e}", file=sys.stderr)
+
+    # Only forget the batch once its results are on disk; the next run submits whatever is still missing
+    os.remove(state_path)
+
+    if written < len(jobs):
+        print(f"[warn] {len(jobs) - written} of {len(jobs)} city/type files not written; rerun to retry them", file=sys.stderr)
 
 def find_missing_twitter(client: OpenAI, model: str, out_root: str, batch_size: int = 20, delay: float = 0.6):
     """Find missing Twitter accounts for all people in existing lists."""
@@ -514,29 +953,27 @@ def find_missing_twitter(client: OpenAI, model: str, out_root: str, batch_size:
     file_contact_map = {}  # Track which file each contact came from
 
     # Scan all CSV files
-    for root, dirs, files in os.walk(out_root):
-        if "contacts.csv" in files:
-            csv_path = os.path.join(root, "contacts.csv")
-            try:
-                with open(csv_path, "r", encoding="utf-8", newline="") as f:
-                    reader = csv.DictReader(f)
-                    for idx, row in enumerate(reader):
-                        # Only process if twitter is missing
-                        if not (row.get("twitter") or "").strip():
-                            contact_key = (csv_path, idx)
-                            contacts_needing_twitter.append({
-                                "name": row.get("name", ""),
-                                "organization": row.get("organization", ""),
-                                "instagram": row.get("instagram", ""),
-                                "type": row.get("type", ""),
-                                "city": row.get("city", ""),
-                                "row": row,
-                                "file": csv_path,
-                                "index": idx
-                            })
-                            file_contact_map[contact_key] = row
-            except Exception as e:
-                print(f"Error reading {csv_path}: {e}", file=sys.stderr)
+    for csv_path in iter_contact_csvs(out_root):
+        try:
+            with open(csv_path, "r", encoding="utf-8", newline="") as f:
+                reader = csv.DictReader(f)
+                for idx, row in enumerate(reader):
+                    # Only process if twitter is missing
+                    if not (row.get("twitter") or "").strip():
+                        row_ref = (csv_path, idx)
+                        contacts_needing_twitter.append({
+                            "name": row.get("name", ""),
+                            "organization": row.get("organization", ""),
+                            "instagram": row.get("instagram", ""),
+                            "type": row.get("type", ""),
+                            "city": row.get("city", ""),
+                            "row": row,
+                            "file": csv_path,
+                            "index": idx
+                        })
+                        file_contact_map[row_ref] = row
+        except Exception as e:
+            print(f"Error reading {csv_path}: {e}", file=sys.stderr)
 
     total = len(contacts_needing_twitter)
     print(f"Found {total} contacts missing Twitter accounts")
@@ -649,7 +1086,11 @@ def main():
     ap.add_argument("--out", default="out", help="Output root directory.")
     ap.add_argument("--model", default="gpt-4o", help="OpenAI model.")
     ap.add_argument("--per-type", type=int, default=100, help="Minimum rows per city/type.")
-    ap.add_argument("--delay", type=float, default=0.6, help="Seconds between API calls.")
+    ap.add_argument("--delay", type=float, default=0.6, help="Seconds between API calls when finding Twitter accounts.")
+    ap.add_argument("--concurrency", type=int, default=8, help="Maximum number of concurrent OpenAI requests.")
+    ap.add_argument("--rpm", type=int, default=500, help="Requests-per-minute budget (updated from API headers).")
+    ap.add_argument("--tpm", type=int, default=30000, help="Tokens-per-minute budget (updated from API headers).")
+    ap.add_argument("--batch", action="store_true", help="Generate missing files through the OpenAI Batch API (cheaper, results within 24h).")
     ap.add_argument("--merge", action="store_true", help="Merge all existing CSV files into one.")
     ap.add_argument("--merge-output", default="merged_contacts.csv", help="Output file for merged results.")
     ap.add_argument("--find-twitter", action="store_true", help="Find missing Twitter accounts for existing contacts.")
@@ -670,7 +1111,7 @@ def main():
     # Load cities
     if args.cities:
         # Filter default cities by provided city names
-        all_cities = create_default_cities()
+        all_cities = DEFAULT_CITY_OBJECTS
         cities = []
         provided_city_names = [name.lower().replace(' ', '_').replace('-', '_') for name in args.cities]
 
@@ -685,7 +1126,6 @@ def main():
         if not cities:
             print(f"No cities found matching: {', '.join(args.cities)}", file=sys.stderr)
             print("Available cities:", file=sys.stderr)
-            all_cities = create_default_cities()
             for city in all_cities[:10]:  # Show first 10 as examples
                 print(f"  {city.get('id', '')}", file=sys.stderr)
             if len(all_cities) > 10:
@@ -693,20 +1133,27 @@ def main():
             sys.exit(1)
     else:
         print("Using default cities list...")
-        cities = create_default_cities()
+        cities = DEFAULT_CITY_OBJECTS
 
     print(f"Processing {len(cities)} cities...")
 
-    client = OpenAI()
-
+    jobs: List[Tuple[dict, str, str]] = []
     for i, city in enumerate(cities, 1):
-        try:
-            city_id = city.get("id", "unknown")
-            print(f"[{i}/{len(cities)}] Processing {city_id}...")
-            run_for_city(client, args.model, city, args.per_type, args.delay, args.out)
-        except Exception as e:
-            cid = city.get("id","unknown")
-            print(f"[warn] {cid}: {e}", file=sys.stderr)
+        city_id = city.get("id", "unknown")
+        print(f"[{i}/{len(cities)}] Checking {city_id}...")
+        jobs.extend((city, ptype, out_path) for ptype, out_path in get_pending_types(args.out, city))
+
+    if not jobs:
+        print("Nothing to generate.")
+        return
+
+    if args.batch:
+        print(f"Generating {len(jobs)} city/type files through the Batch API...")
+        run_batch(OpenAI(), args.model, jobs, args.per_type, args.out)
+        return
+
+    print(f"Generating {len(jobs)} city/type files with concurrency {args.concurrency}...")
+    asyncio.run(run_all(args.model, jobs, args.per_type, args.concurrency, args.rpm, args.tpm))
 
 if __name__ == "__main__":
     main()